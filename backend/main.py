@@ -1,13 +1,14 @@
 import os
-import json
 import uuid
 import asyncio
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timezone
 from typing import List
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
+import orjson
 from urllib.parse import urlparse
 from ollama import AsyncClient
 
@@ -17,12 +18,22 @@ from schemas import (
     SourcesUpdate
 )
 from notebooks import router as notebook_router
+from storage import run_write, write_atomic, append_line, shutdown_writer
 
 # ---------------- config ----------------
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:0.6b")
 
+# One client for the process: its keep-alive pool reuses the connection to
+# Ollama across chat turns instead of reconnecting per message.
+OLLAMA = AsyncClient(
+    host=OLLAMA_HOST,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=300),
+)
+
+CHAT_CONTEXT = 8  # messages sent to the model per turn
+
 MEMORY_DIR = "./memory"
 NOTE_FILE = f"{MEMORY_DIR}/note/notes.json"
 CHAT_FILE = f"{MEMORY_DIR}/chat/chat_history.json"
@@ -35,22 +46,120 @@ for f in [NOTE_FILE, CHAT_FILE, SOURCE_FILE]:
 # ---------------- helpers ----------------
 
 def _now():
-    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 def _load(path, default):
     try:
-        with open(path) as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     except Exception:
         return default
 
-def _save(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
-
-
-notes = _load(NOTE_FILE, [])
-chat = _load(CHAT_FILE, [{"role": "system", "content": "Be concise."}])
+async def _save(path, data):
+    # Encode on the loop so later in-place mutations can't race the write,
+    # then hand the blocking file I/O to a worker thread.
+    payload = orjson.dumps(data)
+    await run_write(write_atomic, path, payload)
+
+
+# Notes and chat are persisted as an append-only journal next to the snapshot
+# (<file>.log, one JSON record per line). Each mutation writes only its own
+# record; the journal is folded back into the snapshot on startup.
+
+def _log_path(path):
+    return f"{path}.log"
+
+async def _journal_append(path, record):
+    # OPT_APPEND_NEWLINE has orjson emit the line terminator itself, so the
+    # encoded record is written as-is without a concatenation copy.
+    line = orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    await run_write(append_line, _log_path(path), line)
+
+def _compact(path, default, apply):
+    # Replaying append/delta records twice would duplicate them, so the fold
+    # is made repeatable: the snapshot the log applies to is frozen as
+    # <file>.base and the log is moved to <file>.log.compacting first. The
+    # result is always base + compacting, so a crash at any point just redoes
+    # the same work on the next startup.
+    log = _log_path(path)
+    pending = f"{log}.compacting"
+    base = f"{path}.base"
+    if not os.path.exists(pending):
+        if not os.path.exists(log):
+            if os.path.exists(base):
+                os.remove(base)  # left over from a crash after the fold
+            return _load(path, default)
+        write_atomic(base, orjson.dumps(_load(path, default)))
+        os.replace(log, pending)
+
+    data = _load(base, default)
+    with open(pending, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except ValueError:
+                break  # torn tail from a crash mid-append
+            apply(data, record)
+
+    write_atomic(path, orjson.dumps(data))
+    os.remove(pending)
+    os.remove(base)
+    if os.path.exists(log):
+        return _compact(path, default, apply)
+    return data
+
+def _default_chat():
+    return [{"role": "system", "content": "Be concise."}]
+
+def _apply_note(notes, record):
+    op = record.get("op")
+    if op == "upsert":
+        note = record["note"]
+        for i, n in enumerate(notes):
+            if n["id"] == note["id"]:
+                notes[i] = note
+                break
+        else:
+            notes.insert(0, note)
+    elif op == "delete":
+        notes[:] = [n for n in notes if n["id"] != record["id"]]
+
+def _chat_replayer():
+    # Assistant replies are journaled as "delta" records while they stream,
+    # then closed by "final" (or "abort" if the stream failed). A turn left
+    # open by a crash keeps whatever text reached the log.
+    turns = {}
+
+    def apply(chat, record):
+        op = record.get("op")
+        if op == "append":
+            chat.append(record["message"])
+        elif op == "delta":
+            reply = turns.get(record["turn"])
+            if reply is None:
+                reply = turns[record["turn"]] = {"role": "assistant", "content": ""}
+                chat.append(reply)
+            reply["content"] += record["content"]
+        elif op == "final":
+            if turns.pop(record["turn"], None) is None:
+                chat.append({"role": "assistant", "content": ""})  # empty reply
+        elif op == "abort":
+            reply = turns.pop(record["turn"], None)
+            if reply is not None:
+                chat[:] = [m for m in chat if m is not reply]
+        elif op == "clear":
+            turns.clear()
+            chat[:] = _default_chat()
+
+    return apply
+
+
+notes = _compact(NOTE_FILE, [], _apply_note)
+notes_by_id = {n["id"]: n for n in notes}  # same dicts as `notes`, for O(1) lookup
+chat = _compact(CHAT_FILE, _default_chat(), _chat_replayer())
+chat_window = deque(chat[-CHAT_CONTEXT:], maxlen=CHAT_CONTEXT)  # what the model sees
 sources = _load(SOURCE_FILE, [])
 
 
@@ -69,6 +178,16 @@ app.add_middleware(
 app.include_router(notebook_router)
 
 
+@app.on_event("shutdown")
+async def _close_ollama():
+    await OLLAMA._client.aclose()
+
+
+@app.on_event("shutdown")
+async def _drain_writes():
+    shutdown_writer()
+
+
 # ---------------- notes ----------------
 
 @app.get("/notes", response_model=List[Note])
@@ -78,47 +197,82 @@ async def get_notes():
 
 @app.post("/notes", response_model=Note)
 async def create_note(req: NoteCreate):
+    now = _now()
     n = {
         "id": str(uuid.uuid4()),
         "title": req.title,
         "content": "",
-        "created_at": _now(),
-        "updated_at": _now(),
+        "created_at": now,
+        "updated_at": now,
     }
     notes.insert(0, n)
-    _save(NOTE_FILE, notes)
+    notes_by_id[n["id"]] = n
+    await _journal_append(NOTE_FILE, {"op": "upsert", "note": n})
     return n
 
 
 @app.put("/notes/{note_id}", response_model=Note)
 async def update_note(note_id: str, req: NoteUpdate):
-    for n in notes:
-        if n["id"] == note_id:
-            if req.title is not None:
-                n["title"] = req.title
-            if req.content is not None:
-                n["content"] = req.content
-            n["updated_at"] = _now()
-            _save(NOTE_FILE, notes)
-            return n
-    raise HTTPException(404, "Note not found")
+    n = notes_by_id.get(note_id)
+    if n is None:
+        raise HTTPException(404, "Note not found")
+
+    if req.title is not None:
+        n["title"] = req.title
+    if req.content is not None:
+        n["content"] = req.content
+    n["updated_at"] = _now()
+    await _journal_append(NOTE_FILE, {"op": "upsert", "note": n})
+    return n
 
 
 @app.delete("/notes/{note_id}")
 async def delete_note(note_id: str):
     global notes
-    original_len = len(notes)
-    notes = [n for n in notes if n["id"] != note_id]
-    
-    if len(notes) == original_len:
+    if notes_by_id.pop(note_id, None) is None:
         raise HTTPException(404, "Note not found")
-    
-    _save(NOTE_FILE, notes)
+
+    notes = [n for n in notes if n["id"] != note_id]
+    await _journal_append(NOTE_FILE, {"op": "delete", "id": note_id})
     return {"ok": True, "deleted": note_id}
 
 
 # ---------------- chat ----------------
 
+CHUNK_FLUSH_SECS = 0.005
+
+
+async def _ws_send(ws: WebSocket, payload):
+    # Text frames (the frontend JSON.parse()s event.data), encoded by orjson.
+    await ws.send_text(orjson.dumps(payload).decode())
+
+
+async def _send_chunks(ws: WebSocket, parts: asyncio.Queue, turn: str):
+    # Tokens that arrive within one flush window go out as a single "chunk"
+    # frame instead of one frame per token, and the same batch is journaled
+    # as a delta of this turn. None flushes the rest and stops.
+    while True:
+        part = await parts.get()
+        if part is None:
+            return
+        await asyncio.sleep(CHUNK_FLUSH_SECS)
+
+        batch = [part]
+        done = False
+        while not parts.empty():
+            part = parts.get_nowait()
+            if part is None:
+                done = True
+                break
+            batch.append(part)
+
+        content = "".join(batch)
+        await _ws_send(ws, {"type": "chunk", "content": content})
+        await _journal_append(CHAT_FILE, {"op": "delta", "turn": turn, "content": content})
+        if done:
+            return
+
+
 @app.get("/chat/history", response_model=List[ChatMessage])
 async def chat_history():
     return chat
@@ -126,9 +280,10 @@ async def chat_history():
 
 @app.post("/chat/clear")
 async def clear_chat():
-    global chat
-    chat = [{"role": "system", "content": "Be concise."}]
-    _save(CHAT_FILE, chat)
+    global chat, chat_window
+    chat = _default_chat()
+    chat_window = deque(chat, maxlen=CHAT_CONTEXT)
+    await _journal_append(CHAT_FILE, {"op": "clear"})
     return {"ok": True}
 
 
@@ -137,14 +292,14 @@ async def ws_chat(ws: WebSocket):
     await ws.accept()
     try:
         while True:
-            data = await ws.receive_json()
+            data = orjson.loads(await ws.receive_text())
             msg_type = data.get("type", "")
             
             # Handle chat messages
             if msg_type == "chat_message":
                 msg = data.get("message", "").strip()
                 if not msg:
-                    await ws.send_json({"type": "error", "message": "Empty message"})
+                    await _ws_send(ws, {"type": "error", "message": "Empty message"})
                     continue
 
                 use_crawl = data.get("use_crawl", False)
@@ -152,7 +307,10 @@ async def ws_chat(ws: WebSocket):
                 urls = data.get("urls", [])
 
                 # Add user message to chat history
-                chat.append({"role": "user", "content": msg})
+                user_msg = {"role": "user", "content": msg}
+                chat.append(user_msg)
+                chat_window.append(user_msg)
+                await _journal_append(CHAT_FILE, {"op": "append", "message": user_msg})
 
                 # Prepare context (you can extend this with crawl/pg logic)
                 context_prefix = ""
@@ -162,37 +320,53 @@ async def ws_chat(ws: WebSocket):
                     context_prefix += "[Using database context]\n\n"
 
                 # Stream response from Ollama
-                client = AsyncClient(host=OLLAMA_HOST)
+                turn = uuid.uuid4().hex
                 full = ""
 
                 try:
-                    async for ev in await client.chat(
+                    parts = asyncio.Queue()
+                    sender = asyncio.create_task(_send_chunks(ws, parts, turn))
+                    stream = await OLLAMA.chat(
                         model=OLLAMA_MODEL,
-                        messages=chat[-8:],  # Keep last 8 messages for context
+                        messages=list(chat_window),
                         stream=True,
-                    ):
-                        part = ev["message"]["content"]
-                        full += part
-                        await ws.send_json({"type": "chunk", "content": part})
+                    )
+                    try:
+                        async for ev in stream:
+                            if sender.done():
+                                # A failed send (client gone) stops generation
+                                sender.result()
+                                break
+                            part = ev["message"]["content"]
+                            full += part
+                            if part:
+                                parts.put_nowait(part)
+                    finally:
+                        await stream.aclose()
+                        parts.put_nowait(None)
+                        await sender
 
                     # Save assistant response
-                    chat.append({"role": "assistant", "content": full})
-                    _save(CHAT_FILE, chat)
-                    await ws.send_json({"type": "complete"})
+                    reply = {"role": "assistant", "content": full}
+                    chat.append(reply)
+                    chat_window.append(reply)
+                    await _journal_append(CHAT_FILE, {"op": "final", "turn": turn})
+                    await _ws_send(ws, {"type": "complete"})
                     
                 except Exception as e:
+                    await _journal_append(CHAT_FILE, {"op": "abort", "turn": turn})
                     error_msg = f"Error during chat: {str(e)}"
-                    await ws.send_json({"type": "error", "message": error_msg})
+                    await _ws_send(ws, {"type": "error", "message": error_msg})
             
             else:
-                await ws.send_json({"type": "error", "message": f"Unknown message type: {msg_type}"})
+                await _ws_send(ws, {"type": "error", "message": f"Unknown message type: {msg_type}"})
                 
     except WebSocketDisconnect:
         print("WebSocket disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
         try:
-            await ws.send_json({"type": "error", "message": str(e)})
+            await _ws_send(ws, {"type": "error", "message": str(e)})
         except:
             pass
 
@@ -208,7 +382,7 @@ async def get_sources():
 async def update_sources(new_sources: List[str]):
     global sources
     sources = new_sources
-    _save(SOURCE_FILE, sources)
+    await _save(SOURCE_FILE, sources)
     return {"sources": sources}
 
 
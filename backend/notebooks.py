@@ -1,18 +1,25 @@
+import io
 import os
+import asyncio
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import nbformat
-from nbclient import NotebookClient
+import orjson
+from jupyter_client.manager import AsyncKernelManager
 from fastapi import APIRouter, HTTPException
+import httpx
 
 from ollama import AsyncClient
 
+from storage import run_write, write_atomic
 from schemas import (
     NBSaveReq,
     NBRunReq,
     NBRunCellReq,
     NBSuggestReq,
+    NBKernelReq,
 )
 
 # -------------------------
@@ -25,30 +32,151 @@ OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
 NOTEBOOK_DIR = Path(os.getenv("NOTEBOOK_DIR", "./notebooks")).resolve()
 NOTEBOOK_DIR.mkdir(parents=True, exist_ok=True)
 
+OLLAMA = AsyncClient(
+    host=OLLAMA_HOST,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=300),
+)
+
+DEBUG_TMPL = """You are debugging a Jupyter notebook cell.
+
+Cell source:
+```python
+{source}
+```
+
+Cell output / error:
+```
+{output_text}
+```
+
+Explain the root cause and propose a corrected version of the code.
+Return strictly:
+1. Short explanation
+2. Corrected code only
+"""
+
+REVIEW_TMPL = """You are reviewing a Jupyter notebook cell.
+
+Cell source:
+```python
+{source}
+```
+
+Suggest improvements to make this code better (performance, readability, best practices).
+Return strictly:
+1. Short explanation
+2. Improved code
+"""
+
 router = APIRouter(prefix="/nb", tags=["notebooks"])
 
 
+@router.on_event("shutdown")
+async def _close_ollama():
+    await OLLAMA._client.aclose()
+
+
+# -------------------------
+# Kernels
+# -------------------------
+
+class KernelPool:
+    """Warm python3 kernels keyed by notebook path, started on first use.
+
+    Keeping the kernel alive between calls skips the kernel boot on every
+    run and keeps imports/variables around like a normal Jupyter session.
+    """
+
+    def __init__(self):
+        self._kernels: Dict[Path, Tuple[AsyncKernelManager, Any]] = {}
+        self._locks: Dict[Path, asyncio.Lock] = {}
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self._kernels
+
+    def lock(self, path: Path) -> asyncio.Lock:
+        # One execution at a time per kernel.
+        return self._locks.setdefault(path, asyncio.Lock())
+
+    async def prune(self, path: Path):
+        # Drop a kernel that has died (exit() in a cell, OOM kill, crash) so
+        # the next get() starts a fresh one instead of timing out on it.
+        entry = self._kernels.get(path)
+        if entry is not None and not await entry[0].is_alive():
+            try:
+                await self.shutdown(path)
+            except Exception:
+                pass  # shutdown() already dropped the entry
+
+    async def get(self, path: Path) -> Tuple[AsyncKernelManager, Any]:
+        await self.prune(path)
+        if path not in self._kernels:
+            km = AsyncKernelManager(kernel_name="python3")
+            await km.start_kernel(cwd=str(NOTEBOOK_DIR))
+            kc = km.client()
+            kc.start_channels()
+            try:
+                await kc.wait_for_ready(timeout=60)
+            except Exception:
+                # Don't leak the kernel process we just started.
+                kc.stop_channels()
+                await km.shutdown_kernel(now=True)
+                raise
+            self._kernels[path] = (km, kc)
+        return self._kernels[path]
+
+    async def shutdown(self, path: Path) -> bool:
+        entry = self._kernels.pop(path, None)
+        if entry is None:
+            return False
+        km, kc = entry
+        kc.stop_channels()
+        await km.shutdown_kernel(now=True)
+        return True
+
+    async def shutdown_all(self):
+        for path in list(self._kernels):
+            await self.shutdown(path)
+
+
+KERNELS = KernelPool()
+
+
+@router.on_event("shutdown")
+async def _shutdown_kernels():
+    await KERNELS.shutdown_all()
+
+
 # -------------------------
 # Helpers
 # -------------------------
 
-def _safe_nb_path(rel_path: str) -> Path:
-    rel_path = (rel_path or "").strip().lstrip("/").replace("\\", "/")
+# NOTEBOOK_DIR is fixed for the life of the process, so the resolve() result
+# for a given request path can be cached. None marks a path outside the dir.
+@lru_cache(maxsize=1024)
+def _resolve_nb_path(rel_path: str) -> Optional[str]:
+    rel_path = rel_path.strip().lstrip("/").replace("\\", "/")
     if not rel_path.endswith(".ipynb"):
         rel_path += ".ipynb"
 
     p = (NOTEBOOK_DIR / rel_path).resolve()
     if NOTEBOOK_DIR not in p.parents and p != NOTEBOOK_DIR:
+        return None
+    return str(p)
+
+
+def _safe_nb_path(rel_path: str) -> Path:
+    p = _resolve_nb_path(rel_path or "")
+    if p is None:
         raise HTTPException(400, "Invalid notebook path")
-    return p
+    return Path(p)
 
 
-def _read_nb(path: Path) -> nbformat.NotebookNode:
+async def _read_nb(path: Path) -> nbformat.NotebookNode:
     if not path.exists():
         nb = nbformat.v4.new_notebook()
         nb.cells = [nbformat.v4.new_markdown_cell("# New notebook")]
-        path.parent.mkdir(parents=True, exist_ok=True)
-        nbformat.write(nb, path)
+        await _write_nb(path, nb)
         return nb
 
     try:
@@ -57,57 +185,162 @@ def _read_nb(path: Path) -> nbformat.NotebookNode:
         raise HTTPException(500, f"Failed to read notebook: {str(e)}")
 
 
-def _write_nb(path: Path, nb: nbformat.NotebookNode):
+NB_DUMP_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+
+
+def _dump_nb(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, data)
+
+
+async def _write_nb(path: Path, nb: nbformat.NotebookNode):
+    # No schema validation here: notebooks written by the API are either
+    # validated on /nb/save or produced by our own kernel output handling.
+    # Indented and key-sorted so repeated API writes are stable. This is not
+    # Jupyter's own layout (1-space indent, sources split into line lists), so
+    # the first API write of a notebook saved by Jupyter reformats it.
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        nbformat.write(nb, path)
+        data = orjson.dumps(nb, option=NB_DUMP_OPTS)
+        await run_write(_dump_nb, path, data)
     except Exception as e:
         raise HTTPException(500, f"Failed to write notebook: {str(e)}")
 
 
-def _execute(nb: nbformat.NotebookNode, timeout: int):
+async def _run_source(
+    km: AsyncKernelManager, kc, source: str, timeout: int
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    outputs: List[Dict[str, Any]] = []
+
+    def collect(msg):
+        msg_type = msg["header"]["msg_type"]
+        if msg_type == "clear_output":
+            outputs.clear()
+        elif msg_type in ("stream", "display_data", "execute_result", "error"):
+            out = nbformat.v4.output_from_msg(msg)
+            last = outputs[-1] if outputs else None
+            if (
+                msg_type == "stream"
+                and last is not None
+                and last.get("output_type") == "stream"
+                and last.get("name") == out.name
+            ):
+                last["text"] += out.text
+            else:
+                outputs.append(out)
+
     try:
-        client = NotebookClient(
-            nb,
-            kernel_name="python3",
-            timeout=timeout,
-            allow_errors=True,
-            resources={"metadata": {"path": str(NOTEBOOK_DIR)}},
+        reply = await kc.execute_interactive(
+            source, timeout=timeout, allow_stdin=False, output_hook=collect
         )
-        return client.execute()
+    except TimeoutError:
+        await km.interrupt_kernel()
+        raise
+    return outputs, reply["content"].get("execution_count")
+
+
+async def _execute(nb: nbformat.NotebookNode, timeout: int, path: Path):
+    try:
+        async with KERNELS.lock(path):
+            km, kc = await KERNELS.get(path)
+            for cell in nb.cells:
+                if cell.cell_type != "code":
+                    continue
+                cell.outputs, cell.execution_count = await _run_source(
+                    km, kc, cell.source, timeout
+                )
+        return nb
     except Exception as e:
         # Even if execution fails, return the notebook with error outputs
         print(f"Execution error: {e}")
         return nb
 
 
+async def _execute_cell(
+    nb: nbformat.NotebookNode, idx: int, timeout: int, path: Path
+) -> List[int]:
+    """Run cell `idx` on the notebook's warm kernel; returns the indices run.
+
+    A kernel that is not running yet is seeded by running the code cells
+    before `idx` first, so the cell sees the state it expects. After that,
+    each call only runs the requested cell.
+    """
+    async with KERNELS.lock(path):
+        await KERNELS.prune(path)  # a replacement kernel must be seeded too
+        seed = path not in KERNELS
+        km, kc = await KERNELS.get(path)
+        ran = []
+        for i in (range(idx + 1) if seed else [idx]):
+            cell = nb.cells[i]
+            if cell.cell_type != "code":
+                continue
+            cell.outputs, cell.execution_count = await _run_source(
+                km, kc, cell.source, timeout
+            )
+            ran.append(i)
+        return ran
+
+
+def _walk_ipynb(root: str, prefix: str = "") -> List[str]:
+    # scandir reports entry types from readdir, so no stat() per entry.
+    items: List[str] = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                items.extend(_walk_ipynb(entry.path, f"{prefix}{entry.name}/"))
+            elif entry.name.endswith(".ipynb"):
+                items.append(prefix + entry.name)
+    return items
+
+
 def _outputs_to_text(outputs: List[Dict[str, Any]]) -> str:
-    lines: List[str] = []
+    buf = io.StringIO()
 
     for o in outputs:
-        if o.get("output_type") == "stream":
+        output_type = o.get("output_type")
+        if output_type == "stream":
             txt = o.get("text", "")
-            if isinstance(txt, list):
-                lines.append("".join(txt))
-            else:
-                lines.append(txt)
+            buf.write("".join(txt) if isinstance(txt, list) else txt)
+            buf.write("\n")
 
-        elif o.get("output_type") == "error":
-            en = o.get("ename", "")
-            ev = o.get("evalue", "")
-            tb = o.get("traceback", [])
-            lines.append(f"{en}: {ev}")
-            if tb:
-                lines.extend(tb)
+        elif output_type == "error":
+            buf.write(f"{o.get('ename', '')}: {o.get('evalue', '')}\n")
+            for line in o.get("traceback", []):
+                buf.write(line)
+                buf.write("\n")
 
-        elif "data" in o and "text/plain" in o["data"]:
+        elif "text/plain" in o.get("data", {}):
             tp = o["data"]["text/plain"]
-            if isinstance(tp, list):
-                lines.append("".join(tp))
-            else:
-                lines.append(tp)
+            buf.write("".join(tp) if isinstance(tp, list) else tp)
+            buf.write("\n")
+
+    return buf.getvalue().strip()
+
+
+# Rendered output text per (notebook, cell index, execution count). Outputs
+# only change when a cell is re-run or the notebook is saved, and those paths
+# drop the affected entries.
+OUTPUT_TEXT_CACHE_SIZE = 256
+_output_text: Dict[Tuple[str, int, Optional[int]], str] = {}
+
 
-    return "\n".join(lines).strip()
+def _cell_output_text(path: Path, idx: int, cell) -> str:
+    key = (str(path), idx, cell.get("execution_count"))
+    text = _output_text.get(key)
+    if text is None:
+        text = _outputs_to_text(cell.get("outputs", []))
+        if len(_output_text) >= OUTPUT_TEXT_CACHE_SIZE:
+            del _output_text[next(iter(_output_text))]
+        _output_text[key] = text
+    return text
+
+
+def _forget_output_text(path: Path, idx: Optional[int] = None):
+    stale = [
+        k for k in _output_text
+        if k[0] == str(path) and (idx is None or k[1] == idx)
+    ]
+    for k in stale:
+        del _output_text[k]
 
 
 # -------------------------
@@ -117,10 +350,7 @@ def _outputs_to_text(outputs: List[Dict[str, Any]]) -> str:
 @router.get("/list")
 async def list_notebooks():
     try:
-        items = [
-            str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")
-            for p in NOTEBOOK_DIR.rglob("*.ipynb")
-        ]
+        items = await asyncio.to_thread(_walk_ipynb, str(NOTEBOOK_DIR))
         return {
             "dir": str(NOTEBOOK_DIR),
             "items": sorted(items),
@@ -132,7 +362,7 @@ async def list_notebooks():
 @router.get("/get")
 async def get_notebook(path: str):
     p = _safe_nb_path(path)
-    nb = _read_nb(p)
+    nb = await _read_nb(p)
     return {
         "path": path,
         "notebook": nb,
@@ -144,8 +374,12 @@ async def save_notebook(req: NBSaveReq):
     p = _safe_nb_path(req.path)
     try:
         nb = nbformat.from_dict(req.notebook)
-        _write_nb(p, nb)
+        nbformat.validate(nb)
+        await _write_nb(p, nb)
+        _forget_output_text(p)
         return {"ok": True, "path": req.path}
+    except nbformat.ValidationError as e:
+        raise HTTPException(400, f"Invalid notebook: {e.message}")
     except Exception as e:
         raise HTTPException(500, f"Failed to save notebook: {str(e)}")
 
@@ -153,10 +387,11 @@ async def save_notebook(req: NBSaveReq):
 @router.post("/run_all")
 async def run_all(req: NBRunReq):
     p = _safe_nb_path(req.path)
-    nb = _read_nb(p)
+    nb = await _read_nb(p)
 
-    executed = _execute(nb, req.timeout)
-    _write_nb(p, executed)
+    executed = await _execute(nb, req.timeout, p)
+    _forget_output_text(p)
+    await _write_nb(p, executed)
 
     return {
         "ok": True,
@@ -168,47 +403,39 @@ async def run_all(req: NBRunReq):
 @router.post("/run_cell")
 async def run_cell(req: NBRunCellReq):
     p = _safe_nb_path(req.path)
-    nb = _read_nb(p)
+    nb = await _read_nb(p)
 
     idx = req.cell_index
     if idx < 0 or idx >= len(nb.cells):
         raise HTTPException(400, f"Invalid cell_index: {idx} (notebook has {len(nb.cells)} cells)")
 
-    # Create a partial notebook with cells up to and including the target cell
-    partial = nbformat.v4.new_notebook(metadata=nb.metadata)
-    partial.cells = nb.cells[: idx + 1]
-
-    executed = _execute(partial, req.timeout)
-    
-    # Extract the executed cell
-    if len(executed.cells) > idx:
-        cell = executed.cells[idx]
-        
-        # Update the original notebook with the execution results
-        nb.cells[idx].outputs = cell.get("outputs", [])
-        nb.cells[idx].execution_count = cell.get("execution_count")
+    try:
+        ran = await _execute_cell(nb, idx, req.timeout, p)
+    except Exception as e:
+        raise HTTPException(500, f"Cell execution failed: {str(e)}")
 
-        _write_nb(p, nb)
+    for i in ran:
+        _forget_output_text(p, i)
+    await _write_nb(p, nb)
 
-        return {
-            "ok": True,
-            "path": req.path,
-            "cell_index": idx,
-            "cell": {
-                "source": cell.source,
-                "outputs": cell.get("outputs", []),
-                "execution_count": cell.get("execution_count"),
-            },
-            "notebook": nb,
-        }
-    else:
-        raise HTTPException(500, "Cell execution failed")
+    cell = nb.cells[idx]
+    return {
+        "ok": True,
+        "path": req.path,
+        "cell_index": idx,
+        "cell": {
+            "source": cell.source,
+            "outputs": cell.get("outputs", []),
+            "execution_count": cell.get("execution_count"),
+        },
+        "notebook": nb,
+    }
 
 
 @router.post("/suggest")
 async def suggest_fix(req: NBSuggestReq):
     p = _safe_nb_path(req.path)
-    nb = _read_nb(p)
+    nb = await _read_nb(p)
 
     idx = req.cell_index
     if idx < 0 or idx >= len(nb.cells):
@@ -218,43 +445,18 @@ async def suggest_fix(req: NBSuggestReq):
 
     source = cell.source or ""
     outputs = cell.get("outputs", [])
-    output_text = _outputs_to_text(outputs)
-
-    # Build the prompt based on whether there's an error or not
-    if output_text and ("error" in output_text.lower() or "traceback" in output_text.lower()):
-        prompt = (
-            "You are debugging a Jupyter notebook cell.\n\n"
-            "Cell source:\n"
-            "```python\n"
-            f"{source}\n"
-            "```\n\n"
-            "Cell output / error:\n"
-            "```\n"
-            f"{output_text}\n"
-            "```\n\n"
-            "Explain the root cause and propose a corrected version of the code.\n"
-            "Return strictly:\n"
-            "1. Short explanation\n"
-            "2. Corrected code only\n"
-        )
+
+    # Build the prompt based on whether the cell raised or not; the output
+    # text is only needed (and only rendered) for the debugging prompt.
+    if any(o.get("output_type") == "error" for o in outputs):
+        output_text = _cell_output_text(p, idx, cell)
+        prompt = DEBUG_TMPL.format(source=source, output_text=output_text)
     else:
-        prompt = (
-            "You are reviewing a Jupyter notebook cell.\n\n"
-            "Cell source:\n"
-            "```python\n"
-            f"{source}\n"
-            "```\n\n"
-            "Suggest improvements to make this code better (performance, readability, best practices).\n"
-            "Return strictly:\n"
-            "1. Short explanation\n"
-            "2. Improved code\n"
-        )
+        prompt = REVIEW_TMPL.format(source=source)
 
     try:
-        client = AsyncClient(host=OLLAMA_HOST)
-
         full = ""
-        async for ev in await client.chat(
+        async for ev in await OLLAMA.chat(
             model=OLLAMA_MODEL,
             messages=[{"role": "user", "content": prompt}],
             stream=True,
@@ -266,3 +468,10 @@ async def suggest_fix(req: NBSuggestReq):
         }
     except Exception as e:
         raise HTTPException(500, f"Failed to generate suggestion: {str(e)}")
+
+
+@router.post("/shutdown")
+async def shutdown_kernel(req: NBKernelReq):
+    p = _safe_nb_path(req.path)
+    stopped = await KERNELS.shutdown(p)
+    return {"ok": True, "path": req.path, "shutdown": stopped}
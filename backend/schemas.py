@@ -53,6 +53,9 @@ class NBRunCellReq(BaseModel):
     cell_index: int
     timeout: int = 120
 
+class NBKernelReq(BaseModel):
+    path: str
+
 
 # ---- model suggestions ----
 class NBSuggestReq(BaseModel):
@@ -0,0 +1,36 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# All persistence (memory JSON files and notebooks) goes through a single
+# writer thread: the event loop never blocks on disk, and writes to the same
+# file land in the order they were submitted.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+
+
+async def run_write(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer, fn, *args)
+
+
+def write_atomic(path, payload):
+    # write -> fsync -> rename: readers see the old file or the new one,
+    # never a truncated mix, even if the process dies mid-write.
+    mode = "wb" if isinstance(payload, bytes) else "w"
+    tmp = f"{path}.tmp"
+    with open(tmp, mode) as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def append_line(path, line):
+    mode = "ab" if isinstance(line, bytes) else "a"
+    with open(path, mode) as f:
+        f.write(line)
+
+
+def shutdown_writer():
+    # Drain queued writes before the process exits.
+    _writer.shutdown(wait=True)
@@ -26,6 +26,11 @@ try:
 except Exception:
     websockets = None  # handled via --skip-ws
 
+try:
+    from orjson import loads as json_loads  # accepts str or bytes frames
+except Exception:
+    json_loads = json.loads
+
 def http_to_ws(url: str) -> str:
     p = urlparse(url)
     scheme = "wss" if p.scheme == "https" else "ws"
@@ -132,12 +137,13 @@ async def ws_chat(base: str, message: str = "Hello from test script", timeout: f
             try:
                 while True:
                     msg = await asyncio.wait_for(ws.recv(), timeout=timeout)
-                    data = json.loads(msg)
+                    data = json_loads(msg)
                     if data.get("type") == "chunk":
                         frag = data.get("content", "")
                         full.append(frag)
                         if frag:
-                            print(f"[WS] chunk: {frag[:60].replace('\\n',' ')}{'...' if len(frag)>60 else ''}")
+                            preview = frag[:60].replace("\n", " ")
+                            print(f"[WS] chunk: {preview}{'...' if len(frag)>60 else ''}")
                     elif data.get("type") == "complete":
                         print("[WS] complete")
                         break
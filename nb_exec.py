@@ -0,0 +1,18 @@
+# Notebook execution for v2main's process pool. Kept separate from v2main
+# because pool workers import the target's module: under spawn/forkserver,
+# importing v2main would re-run its startup side effects (loading/rotating the
+# chat log, creating dirs) inside every worker. This module has none.
+import nbformat
+from nbclient import NotebookClient
+
+
+def execute_notebook(nb: nbformat.NotebookNode, timeout: int, cwd: str) -> nbformat.NotebookNode:
+    # Stateless execution (fresh kernel each run)
+    client = NotebookClient(
+        nb,
+        kernel_name="python3",
+        timeout=timeout,
+        allow_errors=True,
+        resources={"metadata": {"path": cwd}},
+    )
+    return client.execute()
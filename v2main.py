@@ -1,29 +1,49 @@
 import os
-import json
+import re
 import uuid
+import time
 import asyncio
+from collections import deque
+from itertools import islice
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from ollama import AsyncClient
 import httpx
-from urllib.parse import urlparse
+import orjson
+from cachetools import TTLCache
 # import crawl4ai
 
+# libuv-backed event loop when available (not on Windows); uvicorn's
+# loop="auto" picks it up too
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
 
 
-# Import psycopg2 for PostgreSQL
+
+# Import asyncpg for PostgreSQL
 try:
-    import psycopg2
-    from psycopg2 import sql
+    import asyncpg
     _PG_AVAILABLE = True
 except ImportError:
     _PG_AVAILABLE = False
 
 
+# Optional: watchfiles keeps the /nb/list cache up to date incrementally
+try:
+    import watchfiles
+    _WATCHFILES_AVAILABLE = True
+except ImportError:
+    _WATCHFILES_AVAILABLE = False
+
+
 # try crawl4ai lib buat crawl and search
 try:
     from crawl4ai import AsyncWebCrawler
@@ -40,6 +60,7 @@ OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
 USE_CRAWL = os.getenv("USE_CRAWL", "true").lower() == "true"
 USE_PG = os.getenv("USE_PG", "false").lower() == "true" and _PG_AVAILABLE
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
 CRAWL_API_BASE = os.getenv("CRAWL_API_BASE", "http://localhost:8000").rstrip("/")
 
 
@@ -97,10 +118,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared HTTP client for health/reachability probes (keep-alive, HTTP/2)
+@app.on_event("startup")
+async def _open_http_client():
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    )
+
+@app.on_event("shutdown")
+async def _close_http_client():
+    await app.state.http.aclose()
+
 # Storage setup
 MEMORY_DIR = "./memory"
 NOTE_FILE = os.path.join(MEMORY_DIR, "note", "notes.json")
-CHAT_FILE = os.path.join(MEMORY_DIR, "chat", "chat_history.json")
+CHAT_FILE = os.path.join(MEMORY_DIR, "chat", "chat_history.json")  # legacy snapshot
+CHAT_LOG_FILE = os.path.join(MEMORY_DIR, "chat", "chat_history.jsonl")
+CHAT_ARCHIVE_FILE = os.path.join(MEMORY_DIR, "chat", "chat_archive.jsonl")
+CHAT_MEM_MAX = int(os.getenv("CHAT_MEM_MAX", "201"))  # messages kept in memory / in the live log
+CHAT_TURNS_MAX = max(1, CHAT_MEM_MAX - 1)  # plus the pinned system message
 SOURCE_FILE = os.path.join(MEMORY_DIR, "source", "source_history.json")
 
 for path in [NOTE_FILE, CHAT_FILE, SOURCE_FILE]:
@@ -113,74 +151,248 @@ def _now() -> str:
 def _load_json(path: str, default: Any) -> Any:
     try:
         if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
     except Exception:
         pass
     return default
 
 def _save_json(path: str, data: Any):
+    # write tmp -> fsync -> rename, so a crash mid-write leaves the old file intact
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# Chat history is append-only JSONL: one line per message, so a new message
+# costs one short write no matter how long the history is
+def _load_jsonl(path: str) -> Tuple[List[Any], bool]:
+    # Returns (records, intact); reading stops at a torn tail from a crash mid-append
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                records.append(orjson.loads(line))
+            except ValueError:
+                return records, False
+    return records, True
+
+def _save_jsonl(path: str, records: List[Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for r in records:
+            f.write(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _append_jsonl(path: str, record: Any):
+    with open(path, "ab") as f:
+        f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+
+# All chat log writes (appends and rewrites) go through one thread so they
+# land in the order they were issued, across sockets
+_CHAT_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-log")
+
+async def _chat_log_write(fn, *args):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_CHAT_WRITER, fn, CHAT_LOG_FILE, *args)
+
+@app.on_event("shutdown")
+async def _stop_chat_writer():
+    _CHAT_WRITER.shutdown(wait=True)
+
+def _load_chat() -> Tuple[Optional[Dict[str, Any]], deque]:
+    # Returns (system message, turns); the system message is kept apart so
+    # the bounded turn deque never evicts it
+    if os.path.exists(CHAT_LOG_FILE):
+        chat, intact = _load_jsonl(CHAT_LOG_FILE)
+        if not intact:
+            # Drop the torn line so later appends don't land after it
+            _save_jsonl(CHAT_LOG_FILE, chat)
+    else:
+        # First run on the JSONL format: carry over the old snapshot
+        chat = _load_json(CHAT_FILE, [_default_system()])
+        _save_jsonl(CHAT_LOG_FILE, chat)
+    system = chat[0] if chat and chat[0].get("role") == "system" else None
+    turns = chat[1:] if system else chat
+    if len(turns) > CHAT_TURNS_MAX:
+        # Rotate all but the newest CHAT_TURNS_MAX turns into the archive
+        cut = len(turns) - CHAT_TURNS_MAX
+        with open(CHAT_ARCHIVE_FILE, "ab") as f:
+            for r in turns[:cut]:
+                f.write(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE))
+        turns = turns[cut:]
+        _save_jsonl(CHAT_LOG_FILE, ([system] if system else []) + turns)
+    # Bounded in memory; older turns stay in the log until the next rotation
+    return system, deque(turns, maxlen=CHAT_TURNS_MAX)
+
+def _default_system() -> Dict[str, Any]:
+    return {"role": "system", "content": "Be concise. Ground in provided web/DB context when present."}
+
+def _chat_messages() -> List[Dict[str, Any]]:
+    return ([chat_system] if chat_system else []) + list(chat_data)
 
 # Initialize data
 notes_data = _load_json(NOTE_FILE, [])
-chat_data = _load_json(CHAT_FILE, [
-    {"role": "system", "content": "Be concise. Ground in provided web/DB context when present."}
-])
-url_history_data = _load_json(SOURCE_FILE, [])
+url_history_data = list(dict.fromkeys(_load_json(SOURCE_FILE, [])))
 
-def persist_all():
-    _save_json(NOTE_FILE, notes_data)
-    _save_json(CHAT_FILE, chat_data)
-    _save_json(SOURCE_FILE, url_history_data)
+# Chat is loaded (and the log rotated) at startup rather than at import, so
+# anything that merely imports this module, e.g. spawned pool workers, never
+# rewrites the live chat log
+chat_system: Optional[Dict[str, Any]] = None
+chat_data: deque = deque(maxlen=CHAT_TURNS_MAX)
 
-# PostgreSQL context function
-def build_pg_context(query_text: str) -> str:
-    if not USE_PG or not PG_CFG["table"]:
-        return ""
-    
+@app.on_event("startup")
+async def _load_chat_state():
+    global chat_system, chat_data
+    chat_system, chat_data = _load_chat()
+
+# Lookup indexes kept alongside the lists (same note dicts, same urls)
+notes_by_id = {note["id"]: note for note in notes_data}
+url_set = set(url_history_data)
+
+def _add_urls(urls: List[str]) -> bool:
+    added = False
+    for u in urls:
+        if u not in url_set:
+            url_set.add(u)
+            url_history_data.append(u)
+            added = True
+    return added
+
+# Debounced persistence: handlers mark what changed, a background task
+# rewrites only those files after a short delay (batching bursts of edits)
+PERSIST_DELAY = 0.5
+
+_STORES = {
+    "notes": (NOTE_FILE, lambda: notes_data),
+    "sources": (SOURCE_FILE, lambda: url_history_data),
+}
+_DIRTY = set()
+_flush_event: Optional[asyncio.Event] = None
+_flush_task: Optional[asyncio.Task] = None
+_SAVE_LOCK = asyncio.Lock()  # one snapshot write at a time
+
+def mark_dirty(*keys: str):
+    _DIRTY.update(keys)
+    _flush_event.set()
+
+async def _flush_dirty():
+    async with _SAVE_LOCK:
+        keys = list(_DIRTY)
+        _DIRTY.clear()
+        for key in keys:
+            path, get = _STORES[key]
+            # shallow copy so the list can't change size while the thread dumps it
+            await asyncio.to_thread(_save_json, path, list(get()))
+
+async def _flusher():
+    while True:
+        await _flush_event.wait()
+        await asyncio.sleep(PERSIST_DELAY)
+        _flush_event.clear()
+        try:
+            await _flush_dirty()
+        except Exception as e:
+            print(f"Persist error: {e}")
+
+@app.on_event("startup")
+async def _start_flusher():
+    global _flush_event, _flush_task
+    _flush_event = asyncio.Event()
+    _flush_task = asyncio.create_task(_flusher())
+
+@app.on_event("shutdown")
+async def _stop_flusher():
+    # Holding the lock means the flusher isn't mid-write when it's cancelled
+    async with _SAVE_LOCK:
+        _flush_task.cancel()
+        # Write out anything still pending so a shutdown doesn't lose edits
+        for key in list(_DIRTY):
+            path, get = _STORES[key]
+            _save_json(path, get())
+        _DIRTY.clear()
+
+# PostgreSQL query, built once from config
+def _pg_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _build_pg_sql() -> str:
+    if PG_CFG["custom_sql"]:
+        base_sql = PG_CFG["custom_sql"].strip().rstrip(";")
+        return base_sql if " limit " in base_sql.lower() else f"{base_sql} LIMIT {PG_CFG['limit']}"
+    text_col = _pg_ident(PG_CFG["text_col"])
+    return f"""
+        SELECT {text_col} FROM {_pg_ident(PG_CFG["schema"])}.{_pg_ident(PG_CFG["table"])} 
+        WHERE {text_col} ILIKE $1 
+        ORDER BY 1 DESC 
+        LIMIT $2
+    """
+
+PG_SQL = _build_pg_sql() if USE_PG and PG_CFG["table"] else ""
+
+# PostgreSQL connection pool (created on startup when USE_PG is on)
+@app.on_event("startup")
+async def _start_pg_pool():
+    app.state.pg_pool = None
+    if not PG_SQL:
+        return
     try:
-        conn = psycopg2.connect(
+        app.state.pg_pool = await asyncpg.create_pool(
             host=PG_CFG["host"],
             port=PG_CFG["port"],
-            dbname=PG_CFG["dbname"],
+            database=PG_CFG["dbname"],
             user=PG_CFG["user"],
             password=PG_CFG["password"],
-            connect_timeout=5
+            min_size=2,
+            max_size=20,
+            timeout=5,
+            init=lambda conn: conn.execute("SELECT 1"),
         )
-        
-        with conn:
-            cur = conn.cursor()
-            
+    except Exception as e:
+        print(f"PostgreSQL pool error: {e}")
+
+@app.on_event("shutdown")
+async def _close_pg_pool():
+    if app.state.pg_pool is not None:
+        await app.state.pg_pool.close()
+
+# PostgreSQL context function
+async def build_pg_context(query_text: str) -> str:
+    pool = getattr(app.state, "pg_pool", None)
+    if pool is None:
+        return ""
+    
+    try:
+        # conn.fetch() goes through asyncpg's per-connection statement cache,
+        # so PG_SQL is parsed/planned once per connection and reused after.
+        async with pool.acquire(timeout=2.0) as conn:
             if PG_CFG["custom_sql"]:
-                base_sql = PG_CFG["custom_sql"].strip().rstrip(";")
-                sql_to_run = base_sql if " limit " in base_sql.lower() else f"{base_sql} LIMIT {PG_CFG['limit']}"
-                cur.execute(sql_to_run)
+                rows = await conn.fetch(PG_SQL)
             else:
                 like_text = f"%{(query_text or '').strip()[:120]}%"
-                query = sql.SQL("""
-                    SELECT {text_col} FROM {schema}.{table} 
-                    WHERE {text_col} ILIKE %s 
-                    ORDER BY 1 DESC 
-                    LIMIT %s
-                """).format(
-                    text_col=sql.Identifier(PG_CFG["text_col"]),
-                    schema=sql.Identifier(PG_CFG["schema"]),
-                    table=sql.Identifier(PG_CFG["table"])
-                )
-                cur.execute(query, (like_text, PG_CFG["limit"]))
-            
-            rows = cur.fetchall()
-            return "\n\n---\n\n".join(str(row[0]) for row in rows)[:PG_CFG["max_chars"]]
-    
+                rows = await conn.fetch(PG_SQL, like_text, PG_CFG["limit"])
+        return "\n\n---\n\n".join(str(row[0]) for row in rows)[:PG_CFG["max_chars"]]
     except Exception as e:
         print(f"PostgreSQL error: {e}")
         return ""
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+# http(s) scheme plus a non-empty hostname (optional userinfo, [ipv6], port),
+# the same check as urlparse(u).hostname but without building a ParseResult
+_URL_RE = re.compile(
+    r"^https?://(?:[^\s/?#@]*@)?(?:\[[0-9a-f:.]+\]|[^\s/?#:@\[\]]+)(?::\d*)?(?:[/?#]|$)",
+    re.IGNORECASE,
+)
+
+# Crawled markdown per URL; the websocket re-crawls the same source URLs on
+# every message, so reuse results for a while instead of re-fetching
+_CRAWL_CACHE: TTLCache = TTLCache(maxsize=512, ttl=600)
 
 # Crawl function
 async def crawl_urls(urls: List[str], limit_chars: int = 8000) -> CrawlResponse:
@@ -195,32 +407,41 @@ async def crawl_urls(urls: List[str], limit_chars: int = 8000) -> CrawlResponse:
         )
 
     # sanitize urls
-    clean = []
-    for u in urls:
-        u = (u or "").strip()
-        if not u:
-            continue
-        p = urlparse(u)
-        if p.scheme in ("http", "https") and p.netloc:
-            clean.append(u)
+    clean = [u for u in (s.strip() for s in urls if s) if _URL_RE.match(u)]
 
     if not clean:
         return CrawlResponse(markdown="", sources=[])
 
-    parts = []
     try:
-        async with AsyncWebCrawler() as crawler:
-            for u in clean:
-                try:
-                    r = await crawler.arun(u)
-                    md = getattr(r, "markdown", None) or ""
-                    if not md:
-                        md = "(Empty result)"
-                    parts.append(f"# Source: {u}\n\n{md}")
-                except Exception as e:
-                    parts.append(f"# Source: {u}\n\n(Crawl error: {type(e).__name__}: {e})")
-
-        blob = "\n\n---\n\n".join(parts)
+        # One get() per URL: an entry can expire between a check and a lookup
+        parts = {}
+        for u in clean:
+            hit = _CRAWL_CACHE.get(u)
+            if hit is not None:
+                parts[u] = hit
+        to_fetch = [u for u in dict.fromkeys(clean) if u not in parts]
+        if to_fetch:
+            # One crawler (browser session) shared by all URLs, fetched concurrently
+            sem = asyncio.BoundedSemaphore(CRAWL_CONCURRENCY)
+            async with AsyncWebCrawler() as crawler:
+                async def _one(u: str) -> str:
+                    async with sem:
+                        try:
+                            r = await crawler.arun(u)
+                            md = getattr(r, "markdown", None) or ""
+                            if not md:
+                                md = "(Empty result)"
+                            part = f"# Source: {u}\n\n{md}"
+                            # Errors aren't cached so the next message retries
+                            _CRAWL_CACHE[u] = part
+                            return part
+                        except Exception as e:
+                            return f"# Source: {u}\n\n(Crawl error: {type(e).__name__}: {e})"
+
+                fetched = await asyncio.gather(*[_one(u) for u in to_fetch])
+            parts.update(zip(to_fetch, fetched))
+
+        blob = "\n\n---\n\n".join(parts[u] for u in clean)
         return CrawlResponse(markdown=blob[:limit_chars], sources=clean)
     except Exception as e:
         return CrawlResponse(
@@ -229,11 +450,7 @@ async def crawl_urls(urls: List[str], limit_chars: int = 8000) -> CrawlResponse:
         )
 
 def _ollama_host_ok(url: str) -> bool:
-    try:
-        p = urlparse(url or "")
-        return bool(p.scheme in ("http", "https") and p.hostname)
-    except Exception:
-        return False
+    return bool(_URL_RE.match(url or ""))
 
 
 # Routes
@@ -254,6 +471,12 @@ async def crawl_debug(req: CrawlRequest):
     res = await crawl_urls(req.urls, req.limit_chars)
     return res.dict()
 
+@app.post("/crawl/cache/clear")
+async def crawl_cache_clear():
+    n = len(_CRAWL_CACHE)
+    _CRAWL_CACHE.clear()
+    return {"ok": True, "cleared": n}
+
 # Notes endpoints
 @app.get("/notes", response_model=List[Note])
 async def get_notes():
@@ -261,10 +484,10 @@ async def get_notes():
 
 @app.get("/notes/{note_id}")
 async def get_note(note_id: str):
-    for note in notes_data:
-        if note["id"] == note_id:
-            return note
-    raise HTTPException(status_code=404, detail="Note not found")
+    note = notes_by_id.get(note_id)
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
 
 @app.post("/notes", response_model=Note)
 async def create_note(note_create: NoteCreate):
@@ -280,46 +503,80 @@ async def create_note(note_create: NoteCreate):
     }
     
     notes_data.insert(0, new_note)
-    persist_all()
+    notes_by_id[note_id] = new_note
+    mark_dirty("notes")
     return new_note
 
 @app.put("/notes/{note_id}", response_model=Note)
 async def update_note(note_id: str, note_update: NoteUpdate):
-    for note in notes_data:
-        if note["id"] == note_id:
-            if note_update.title is not None:
-                note["title"] = note_update.title
-            if note_update.content is not None:
-                note["content"] = note_update.content
-            note["updated_at"] = _now()
-            persist_all()
-            return note
-    
-    raise HTTPException(status_code=404, detail="Note not found")
+    note = notes_by_id.get(note_id)
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    if note_update.title is not None:
+        note["title"] = note_update.title
+    if note_update.content is not None:
+        note["content"] = note_update.content
+    note["updated_at"] = _now()
+    mark_dirty("notes")
+    return note
 
 @app.delete("/notes/{note_id}")
 async def delete_note(note_id: str):
     global notes_data
-    notes_data = [note for note in notes_data if note["id"] != note_id]
-    persist_all()
+    if notes_by_id.pop(note_id, None) is not None:
+        notes_data = [note for note in notes_data if note["id"] != note_id]
+        mark_dirty("notes")
     return {"message": "Note deleted"}
 
 # Chat endpoints
 @app.get("/chat/history", response_model=List[ChatMessage])
 async def get_chat_history():
-    return chat_data
+    return _chat_messages()
 
 @app.post("/chat/clear")
 async def clear_chat_history():
-    global chat_data
-    chat_data = [
-        {"role": "system", "content": "Be concise. Ground in provided web/DB context when present."}
-    ]
-    persist_all()
+    global chat_system, chat_data
+    chat_system = _default_system()
+    chat_data = deque(maxlen=CHAT_TURNS_MAX)
+    await _chat_log_write(_save_jsonl, _chat_messages())
     return {"message": "Chat history cleared"}
 
 
 # WebSocket for real-time chat
+# Streamed chunks are batched into frames of ~256 chars or 20 ms
+CHUNK_FLUSH_CHARS = 256
+CHUNK_FLUSH_SECS = 0.02
+
+async def _ws_send(websocket: WebSocket, payload: Dict[str, Any]):
+    # orjson-encoded, but still a text frame: the frontend JSON.parse()s event.data
+    await websocket.send_text(orjson.dumps(payload).decode())
+
+async def _send_chunks(websocket: WebSocket, parts: asyncio.Queue):
+    # Runs beside the token loop: a frame goes out CHUNK_FLUSH_SECS after the
+    # first buffered token (or at CHUNK_FLUSH_CHARS), even if generation
+    # stalls and no further token arrives. None flushes the rest and stops.
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        part = await parts.get()
+        if part is None:
+            return
+        buf = [part]
+        size = len(part)
+        deadline = loop.time() + CHUNK_FLUSH_SECS
+        while size < CHUNK_FLUSH_CHARS:
+            try:
+                part = await asyncio.wait_for(parts.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            if part is None:
+                done = True
+                break
+            buf.append(part)
+            size += len(part)
+        await _ws_send(websocket, {"type": "chunk", "content": "".join(buf)})
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     await websocket.accept()
@@ -327,7 +584,7 @@ async def websocket_chat(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = orjson.loads(await websocket.receive_text())
             if data.get("type") != "chat_message":
                 continue
 
@@ -338,7 +595,9 @@ async def websocket_chat(websocket: WebSocket):
                 continue
 
             # Add user message to chat history
-            chat_data.append({"role": "user", "content": user_message})
+            user_entry = {"role": "user", "content": user_message}
+            chat_data.append(user_entry)
+            await _chat_log_write(_append_jsonl, user_entry)
 
             # Optional contexts
             context_messages = []
@@ -347,11 +606,9 @@ async def websocket_chat(websocket: WebSocket):
 
             # Accept urls from chat payload OR stored history
             payload_urls = data.get("urls", [])
-            crawl_urls_input = list(set(url_history_data + payload_urls))
-
-            if payload_urls:
-                url_history_data[:] = list(set(url_history_data + payload_urls))
-                persist_all()
+            if _add_urls(payload_urls):
+                mark_dirty("sources")
+            crawl_urls_input = list(url_history_data)
 
             if use_crawl and crawl_urls_input:
                 crawl_result = await crawl_urls(crawl_urls_input)
@@ -361,7 +618,7 @@ async def websocket_chat(websocket: WebSocket):
                         "content": f"Web context:\n\n{crawl_result.markdown}"
                     })
             if use_pg:
-                pg_context = build_pg_context(user_message)
+                pg_context = await build_pg_context(user_message)
                 if pg_context:
                     context_messages.append({
                         "role": "system",
@@ -369,10 +626,13 @@ async def websocket_chat(websocket: WebSocket):
                     })
 
             # Combine system + last 8 messages
-            llm_messages = context_messages + chat_data[-8:]
+            recent = list(islice(chat_data, max(0, len(chat_data) - 8), None))
+            if chat_system and len(recent) < 8:
+                recent.insert(0, chat_system)
+            llm_messages = context_messages + recent
 
             if not _ollama_host_ok(OLLAMA_HOST):
-                await websocket.send_json({
+                await _ws_send(websocket, {
                     "type": "error",
                     "message": f"Ollama host invalid: {OLLAMA_HOST!r}. Set OLLAMA_HOST (e.g. http://localhost:11434)."
                 })
@@ -381,38 +641,43 @@ async def websocket_chat(websocket: WebSocket):
             try:
                 client = AsyncClient(host=OLLAMA_HOST)
                 full_response = ""
-                await websocket.send_json({"type": "status", "stage": "generating"})
-
-                # Correct async stream consumption
-                async for event in await client.chat(
-                    model=OLLAMA_MODEL,
-                    messages=llm_messages,
-                    stream=True
-                ):
-                    msg = event.get("message", {})
-                    content = msg.get("content", "")
-                    if content:
-                        full_response += content
-                        # Send partial text immediately to frontend
-                        await websocket.send_json({
-                            "type": "chunk",
-                            "content": content
-                        })
-                        # Tiny yield keeps loop responsive
-                        await asyncio.sleep(0.001)
+                await _ws_send(websocket, {"type": "status", "stage": "generating"})
+
+                # Tokens go to a sender task that batches them into frames
+                parts: asyncio.Queue = asyncio.Queue()
+                sender = asyncio.create_task(_send_chunks(websocket, parts))
+                try:
+                    async for event in await client.chat(
+                        model=OLLAMA_MODEL,
+                        messages=llm_messages,
+                        stream=True
+                    ):
+                        if sender.done():
+                            # A failed send (client gone) stops generation
+                            sender.result()
+                            break
+                        msg = event.get("message", {})
+                        content = msg.get("content", "")
+                        if content:
+                            full_response += content
+                            parts.put_nowait(content)
+                finally:
+                    parts.put_nowait(None)
+                    await sender
 
                 # Finalize and persist
-                chat_data.append({"role": "assistant", "content": full_response})
-                persist_all()
-                await websocket.send_json({"type": "complete"})
+                reply_entry = {"role": "assistant", "content": full_response}
+                chat_data.append(reply_entry)
+                await _chat_log_write(_append_jsonl, reply_entry)
+                await _ws_send(websocket, {"type": "complete"})
                 print("Response streamed successfully")
 
             except Exception as e:
-                await websocket.send_json({
+                await _ws_send(websocket, {
                     "type": "error",
                     "message": f"Ollama stream failed: {e}"
                 })
-                await websocket.send_json({"type": "complete"})
+                await _ws_send(websocket, {"type": "complete"})
                 continue
 
     except WebSocketDisconnect:
@@ -420,7 +685,7 @@ async def websocket_chat(websocket: WebSocket):
     except Exception as e:
         print(f"WebSocket error: {e}")
         try:
-            await websocket.send_json({"type": "error", "message": str(e)})
+            await _ws_send(websocket, {"type": "error", "message": str(e)})
         except Exception:
             pass
 
@@ -431,17 +696,16 @@ async def get_sources():
 
 @app.post("/sources")
 async def add_sources(urls: List[str]):
-    global url_history_data
     # Add new URLs, remove duplicates
-    url_history_data = list(set(url_history_data + urls))
-    persist_all()
+    if _add_urls(urls):
+        mark_dirty("sources")
     return {"sources": url_history_data}
 
 @app.delete("/sources")
 async def clear_sources():
-    global url_history_data
-    url_history_data = []
-    persist_all()
+    url_history_data.clear()
+    url_set.clear()
+    mark_dirty("sources")
     return {"message": "Sources cleared"}
 
 @app.get("/ollama/health")
@@ -449,9 +713,8 @@ async def ollama_health():
     if not _ollama_host_ok(OLLAMA_HOST):
         raise HTTPException(400, f"Invalid OLLAMA_HOST={OLLAMA_HOST!r}")
     try:
-        async with httpx.AsyncClient(timeout=5.0) as hc:
-            r = await hc.get(f"{OLLAMA_HOST}/api/tags")
-            r.raise_for_status()
+        r = await app.state.http.get(f"{OLLAMA_HOST}/api/tags", timeout=5.0)
+        r.raise_for_status()
         return {"ok": True, "host": OLLAMA_HOST, "model": OLLAMA_MODEL}
     except Exception as e:
         raise HTTPException(502, f"Ollama unreachable: {e}")
@@ -465,21 +728,146 @@ async def ollama_health():
 
 # ======== NOTEBOOK (Option B: no iframe) ========
 import nbformat
-from nbclient import NotebookClient
 from nbclient.exceptions import CellExecutionError
+from nbformat.v4.rwbase import rejoin_lines
+from jupyter_client.manager import AsyncKernelManager
+from nb_exec import execute_notebook
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from bisect import insort
 
 NOTEBOOK_DIR = Path(os.getenv("NOTEBOOK_DIR", "./notebooks")).resolve()
 NOTEBOOK_DIR.mkdir(parents=True, exist_ok=True)
+NB_DIR_STR = str(NOTEBOOK_DIR)
+NB_ROOT = NB_DIR_STR + os.sep
+
+# Notebook execution runs in worker processes so a long run doesn't block
+# the event loop (chat streaming, other requests)
+NB_EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+@app.on_event("shutdown")
+async def _stop_nb_executor():
+    NB_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+# Long-lived kernels per notebook for /nb/run_cell: no kernel boot per request,
+# and variables/imports persist between cells like a normal Jupyter session
+KERNELS: Dict[str, AsyncKernelManager] = {}
+_KERNEL_CLIENTS: Dict[str, Any] = {}
+_KERNEL_LOCKS: Dict[str, asyncio.Lock] = {}
+_KERNEL_SEEDED = set()  # kernels that have already run the cells above a run_cell target
+
+async def _get_kernel(key: str):
+    km = KERNELS.get(key)
+    if km is not None and not await km.is_alive():
+        # Died (exit() in a cell, OOM, crash): replace it; dropping it also
+        # clears the seeded flag so the cells above get re-run
+        try:
+            await _stop_kernel(key)
+        except Exception:
+            pass
+        km = None
+    if km is None:
+        km = AsyncKernelManager(kernel_name="python3")
+        await km.start_kernel(cwd=str(NOTEBOOK_DIR))
+        kc = km.client()
+        kc.start_channels()
+        try:
+            await kc.wait_for_ready(timeout=60)
+        except Exception:
+            kc.stop_channels()
+            await km.shutdown_kernel(now=True)
+            raise
+        KERNELS[key] = km
+        _KERNEL_CLIENTS[key] = kc
+    return km, _KERNEL_CLIENTS[key]
+
+async def _stop_kernel(key: str) -> bool:
+    km = KERNELS.pop(key, None)
+    _KERNEL_SEEDED.discard(key)
+    if km is None:
+        return False
+    _KERNEL_CLIENTS.pop(key).stop_channels()
+    await km.shutdown_kernel(now=True)
+    return True
+
+@app.on_event("shutdown")
+async def _stop_kernels():
+    for key in list(KERNELS):
+        await _stop_kernel(key)
 
 def _safe_nb_path(rel_path: str) -> Path:
     rel_path = (rel_path or "").strip().lstrip("/").replace("\\", "/")
     if not rel_path.endswith(".ipynb"):
         rel_path += ".ipynb"
-    p = (NOTEBOOK_DIR / rel_path).resolve()
-    if NOTEBOOK_DIR not in p.parents and p != NOTEBOOK_DIR:
+    # normpath collapses ".." without touching the filesystem
+    p = os.path.normpath(os.path.join(NB_DIR_STR, rel_path))
+    if not (p == NB_DIR_STR or p.startswith(NB_ROOT)):
         raise HTTPException(status_code=400, detail="Invalid notebook path")
-    return p
+    return Path(p)
+
+# /nb/list cache. With watchfiles the list is patched from filesystem events;
+# without it, it's re-scanned when NOTEBOOK_DIR's mtime changes (top-level
+# adds/removes). Our own writes are added directly either way.
+_NB_LIST_CACHE = {"mtime": -1, "items": [], "watching": False}
+
+def _nb_rel(path) -> str:
+    return str(Path(path).relative_to(NOTEBOOK_DIR)).replace("\\", "/")
+
+def _scan_nb_list() -> List[str]:
+    return sorted(_nb_rel(p) for p in NOTEBOOK_DIR.rglob("*.ipynb"))
+
+def _nb_list_add(path):
+    items = _NB_LIST_CACHE["items"]
+    rel = _nb_rel(path)
+    if rel not in items:
+        insort(items, rel)
+
+async def _watch_notebooks(stop: asyncio.Event):
+    # yield_on_timeout makes awatch yield (possibly empty) once its watcher is
+    # subscribed; only then is the list scanned and the mtime fallback turned
+    # off, so nothing changed before the subscription is missed
+    try:
+        async for changes in watchfiles.awatch(NOTEBOOK_DIR, stop_event=stop, rust_timeout=1000, yield_on_timeout=True):
+            if not _NB_LIST_CACHE["watching"]:
+                _NB_LIST_CACHE["items"] = await asyncio.to_thread(_scan_nb_list)
+                _NB_LIST_CACHE["watching"] = True
+                continue
+            rescan = False
+            for change, path in changes:
+                if not path.endswith(".ipynb"):
+                    # A removed/renamed directory only reports itself; other
+                    # deletions (e.g. our own *.tmp renames) don't matter
+                    if change == watchfiles.Change.deleted and not rescan:
+                        prefix = _nb_rel(path) + "/"
+                        rescan = any(i.startswith(prefix) for i in _NB_LIST_CACHE["items"])
+                elif change == watchfiles.Change.added:
+                    _nb_list_add(path)
+                elif change == watchfiles.Change.deleted:
+                    rel = _nb_rel(path)
+                    if rel in _NB_LIST_CACHE["items"]:
+                        _NB_LIST_CACHE["items"].remove(rel)
+            if rescan:
+                _NB_LIST_CACHE["items"] = await asyncio.to_thread(_scan_nb_list)
+    finally:
+        _NB_LIST_CACHE["watching"] = False
+        _NB_LIST_CACHE["mtime"] = -1
+
+@app.on_event("startup")
+async def _start_nb_watcher():
+    app.state.nb_watcher = None
+    if _WATCHFILES_AVAILABLE:
+        app.state.nb_watch_stop = asyncio.Event()
+        app.state.nb_watcher = asyncio.create_task(_watch_notebooks(app.state.nb_watch_stop))
+
+@app.on_event("shutdown")
+async def _stop_nb_watcher():
+    if app.state.nb_watcher is not None:
+        # Let awatch exit on its own so its watcher thread is joined
+        app.state.nb_watch_stop.set()
+        try:
+            await asyncio.wait_for(app.state.nb_watcher, timeout=5)
+        except Exception:
+            pass
 
 def _new_notebook() -> nbformat.NotebookNode:
     nb = nbformat.v4.new_notebook()
@@ -496,14 +884,32 @@ def _read_nb(path: Path) -> nbformat.NotebookNode:
         path.parent.mkdir(parents=True, exist_ok=True)
         with open(path, "w", encoding="utf-8") as f:
             nbformat.write(nb, f)
+        _nb_list_add(path)
         return nb
-    with open(path, "r", encoding="utf-8") as f:
-        return nbformat.read(f, as_version=4)
+    return _parse_nb(path)
+
+def _parse_nb(path: Path) -> nbformat.NotebookNode:
+    # Trusted files we wrote ourselves: plain parse, no JSON-Schema validation
+    nb = nbformat.from_dict(orjson.loads(path.read_bytes()))
+    if nb.get("nbformat") != 4:
+        nb = nbformat.convert(nb, 4)
+    # On disk, multiline sources/outputs are stored as lists of lines
+    return rejoin_lines(nb)
 
 def _write_nb(path: Path, nb: nbformat.NotebookNode):
+    _write_nb_file(path, nb)
+    _nb_list_add(path)
+
+def _write_nb_file(path: Path, nb: nbformat.NotebookNode):
+    # File I/O only (safe off the event loop); callers update the list cache
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
+    # tmp + rename so a reader never sees a half-written notebook
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         nbformat.write(nb, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 class NBSaveReq(BaseModel):
     path: str
@@ -518,65 +924,75 @@ class NBRunCellReq(BaseModel):
     cell_index: int
     timeout: int = 120
 
+class NBKernelReq(BaseModel):
+    path: str
+
 @app.get("/nb/list")
 async def nb_list():
-    items = []
-    for p in NOTEBOOK_DIR.rglob("*.ipynb"):
-        rel = str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")
-        items.append(rel)
-    items.sort()
-    return {"dir": str(NOTEBOOK_DIR), "items": items}
+    if not _NB_LIST_CACHE["watching"]:
+        mtime = NOTEBOOK_DIR.stat().st_mtime_ns
+        if mtime != _NB_LIST_CACHE["mtime"]:
+            _NB_LIST_CACHE["items"] = await asyncio.to_thread(_scan_nb_list)
+            _NB_LIST_CACHE["mtime"] = mtime
+    return {"dir": str(NOTEBOOK_DIR), "items": list(_NB_LIST_CACHE["items"])}
 
 @app.get("/nb/get")
 async def nb_get(path: str):
     p = _safe_nb_path(path)
-    nb = _read_nb(p)
-    return {"path": str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/"), "notebook": nb}
+    rel = str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")
+    try:
+        if not p.exists():
+            raw = orjson.dumps(_read_nb(p))
+        else:
+            raw = p.read_bytes()
+            # orjson parse is cheap and catches corrupt files; only v4 is sent as-is
+            if orjson.loads(raw).get("nbformat") != 4:
+                raw = orjson.dumps(_read_nb(p))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read notebook: {type(e).__name__}: {e}")
+    # Splice the file bytes into the response instead of re-encoding them
+    body = b'{"path":' + orjson.dumps(rel) + b',"notebook":' + raw + b"}"
+    return Response(body, media_type="application/json")
 
 # tiap save trus run pathnya ada disini, buat jupyter notebook
 @app.post("/nb/save")
 async def nb_save(req: NBSaveReq):
     p = _safe_nb_path(req.path)
     nb = nbformat.from_dict(req.notebook)
+    try:
+        nbformat.validate(nb)
+    except nbformat.ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid notebook: {e.message}")
     _write_nb(p, nb)
     return {"ok": True, "path": str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")}
 
-def _execute_notebook(nb: nbformat.NotebookNode, timeout: int) -> nbformat.NotebookNode:
-    # Stateless execution (fresh kernel each run)
-    client = NotebookClient(
-        nb,
-        kernel_name="python3",
-        timeout=timeout,
-        allow_errors=True,
-        resources={"metadata": {"path": str(NOTEBOOK_DIR)}},
-    )
-    return client.execute()
+async def _execute_notebook(nb: nbformat.NotebookNode, timeout: int) -> nbformat.NotebookNode:
+    # Runs on NB_EXECUTOR; the worker only imports nb_exec, not this module
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(NB_EXECUTOR, execute_notebook, nb, timeout, NB_DIR_STR)
 
 # buat save notebook output
-def _save_all_notebook_output():
-    # Get all outputs from cells executed within the notebook
-    outputs = []
-    for p in NOTEBOOK_DIR.rglob("*.ipynb"):
-        rel_path = str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")
-        with open(p, "r") as f:
-            notebooks = json.load(f)
-
-        output_data = []
-        for notebook in notebooks:
-            cell_index = int(notebook.get("cells", {}).get("cells", []).index(notebook["cell_id"]))
-            try:
-                executed_cell = _execute_notebook(notebook["cells"][cell_index], 5)  # 5 seconds timeout
-                output_data.append(executed_cell.get("outputs", []))
-
-            except Exception as e:
-                print(f"Error executing cell {notebook['cell_id']}: {e}")
-
-        outputs.extend(output_data)
-
-    # Write the output to JSON file
-    p = Path(NOTEBOOK_DIR / rel_path).resolve()
-    with open(p, "w") as f:
-        json.dump(outputs, f)
+async def _save_all_notebook_outputs(timeout: int = 30):
+    # Re-run every notebook in the tree (in parallel on the process pool) and
+    # save the executed notebooks with their outputs
+    paths = await asyncio.to_thread(lambda: sorted(NOTEBOOK_DIR.rglob("*.ipynb")))
+    nbs = await asyncio.gather(*[asyncio.to_thread(_parse_nb, p) for p in paths], return_exceptions=True)
+    readable = []
+    for p, nb in zip(paths, nbs):
+        if isinstance(nb, BaseException):
+            print(f"Error reading {_nb_rel(p)}: {type(nb).__name__}: {nb}")
+        else:
+            readable.append((p, nb))
+    executed = await asyncio.gather(
+        *[_execute_notebook(nb, timeout) for _, nb in readable],
+        return_exceptions=True,
+    )
+    for (p, _), ex in zip(readable, executed):
+        if isinstance(ex, BaseException):
+            print(f"Error executing {_nb_rel(p)}: {type(ex).__name__}: {ex}")
+            continue
+        await asyncio.to_thread(_write_nb_file, p, ex)
+        _nb_list_add(p)  # on the loop, not the worker thread
 
 
 @app.post("/nb/run_all")
@@ -585,12 +1001,51 @@ async def nb_run_all(req: NBRunReq):
     nb = _read_nb(p)
 
     try:
-        executed = _execute_notebook(nb, req.timeout)
+        executed = await _execute_notebook(nb, req.timeout)
         _write_nb(p, executed)
         return {"ok": True, "path": str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/"), "notebook": executed}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Notebook execution failed: {type(e).__name__}: {e}")
 
+@app.post("/nb/kernel/start")
+async def nb_kernel_start(req: NBKernelReq):
+    p = _safe_nb_path(req.path)
+    key = str(p)
+    async with _KERNEL_LOCKS.setdefault(key, asyncio.Lock()):
+        await _get_kernel(key)
+    return {"ok": True, "path": str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/")}
+
+@app.post("/nb/kernel/stop")
+async def nb_kernel_stop(req: NBKernelReq):
+    p = _safe_nb_path(req.path)
+    key = str(p)
+    async with _KERNEL_LOCKS.setdefault(key, asyncio.Lock()):
+        stopped = await _stop_kernel(key)
+    return {"ok": True, "stopped": stopped}
+
+async def _run_cell_source(km: AsyncKernelManager, kc, source: str, timeout: int):
+    # Collect iopub output until the kernel goes idle, as nbformat outputs
+    outputs: List[Dict[str, Any]] = []
+
+    def collect(msg):
+        msg_type = msg["header"]["msg_type"]
+        if msg_type == "clear_output":
+            outputs.clear()
+        elif msg_type in ("stream", "display_data", "execute_result", "error"):
+            out = nbformat.v4.output_from_msg(msg)
+            last = outputs[-1] if outputs else None
+            if msg_type == "stream" and last is not None and last.get("output_type") == "stream" and last.get("name") == out.name:
+                last["text"] += out.text
+            else:
+                outputs.append(out)
+
+    try:
+        reply = await kc.execute_interactive(source, timeout=timeout, allow_stdin=False, output_hook=collect)
+    except TimeoutError:
+        await km.interrupt_kernel()
+        raise
+    return outputs, reply["content"].get("execution_count")
+
 # ini API buat run specific cell trs return output
 @app.post("/nb/run_cell")
 async def nb_run_cell(req: NBRunCellReq):
@@ -601,25 +1056,29 @@ async def nb_run_cell(req: NBRunCellReq):
     if idx < 0 or idx >= len(nb.cells):
         raise HTTPException(status_code=400, detail="Invalid cell_index")
 
-    # Execute from start up to idx to preserve "state" (still stateless kernel per request)
-    partial = nbformat.v4.new_notebook(metadata=nb.metadata)
-    partial.cells = [nb.cells[i] for i in range(0, idx + 1)]
-
+    cell = nb.cells[idx]
     try:
-        executed_partial = _execute_notebook(partial, req.timeout)
-        executed_cell = executed_partial.cells[-1]
-
-        # Merge outputs back into original notebook for that cell index
-        nb.cells[idx]["outputs"] = executed_cell.get("outputs", [])
-        nb.cells[idx]["execution_count"] = executed_cell.get("execution_count", None)
-
-        _write_nb(p, nb)
+        if cell.cell_type == "code":
+            key = str(p)
+            # One execution at a time per kernel
+            async with _KERNEL_LOCKS.setdefault(key, asyncio.Lock()):
+                km, kc = await _get_kernel(key)
+                if key not in _KERNEL_SEEDED:
+                    # Fresh kernel: run the code cells above once so this cell
+                    # sees the state it expects
+                    for prev in nb.cells[:idx]:
+                        if prev.cell_type == "code":
+                            prev["outputs"], prev["execution_count"] = await _run_cell_source(km, kc, prev.source, req.timeout)
+                    _KERNEL_SEEDED.add(key)
+                cell["outputs"], cell["execution_count"] = await _run_cell_source(km, kc, cell.source, req.timeout)
+
+            _write_nb(p, nb)
 
         return {
             "ok": True,
             "path": str(p.relative_to(NOTEBOOK_DIR)).replace("\\", "/"),
             "cell_index": idx,
-            "cell": executed_cell,
+            "cell": cell,
             "notebook": nb,  # return updated notebook so UI can refresh cleanly
         }
     except Exception as e:
@@ -660,22 +1119,35 @@ def _build_jupyter_iframe_url() -> str:
     token_qs = f"?token={JUPYTER_TOKEN}" if JUPYTER_TOKEN else ""
     return f"{base}{path}{token_qs}"
 
-@app.get("/jupyter/info")
-async def get_jupyter_info():
-    iframe_url = _build_jupyter_iframe_url()
+# Reachability is probed in the background and cached for JUPYTER_PROBE_TTL
+# seconds, so /jupyter/info never waits on the Jupyter server
+JUPYTER_PROBE_TTL = 5.0
+_JUP_STATE = {"reachable": False, "checked_at": 0.0, "task": None}
 
-    # optional reachability probe (keeps endpoint fast)
-    reachable = False
+async def _refresh_jup(url: str):
     try:
-        async with httpx.AsyncClient(timeout=2.5) as hc:
-            r = await hc.get(iframe_url.split("?")[0])
-            reachable = r.status_code < 500
+        r = await app.state.http.get(url, timeout=2.5)
+        reachable = r.status_code < 500
     except Exception:
         reachable = False
+    _JUP_STATE["reachable"] = reachable
+    _JUP_STATE["checked_at"] = time.monotonic()
+
+@app.get("/jupyter/info")
+async def get_jupyter_info():
+    iframe_url = _build_jupyter_iframe_url()
+
+    if time.monotonic() - _JUP_STATE["checked_at"] >= JUPYTER_PROBE_TTL:
+        task = _JUP_STATE["task"]
+        if task is None or task.done():
+            task = _JUP_STATE["task"] = asyncio.create_task(_refresh_jup(iframe_url.split("?")[0]))
+        if not _JUP_STATE["checked_at"]:
+            # Nothing cached yet: wait for the first probe
+            await asyncio.shield(task)
 
     return {
         "iframe_url": iframe_url,     # ✅ frontend should iframe this
-        "reachable": reachable,
+        "reachable": _JUP_STATE["reachable"],
         "host": JUPYTER_HOST,
         "port": JUPYTER_PORT,
         "path": JUPYTER_PATH,
@@ -685,4 +1157,13 @@ async def get_jupyter_info():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Single worker on purpose: chat memory, kernels and caches live in this
+    # process. "auto" picks uvloop/httptools when they're installed.
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=75,
+    )
\ No newline at end of file